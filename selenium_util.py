@@ -3,117 +3,267 @@
 
 from abc import ABCMeta
 from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support.ui import WebDriverWait
-import time
+import pkgutil
+import re
+
+_JS_OBTEM_ATRIBUTO = pkgutil.get_data('selenium.webdriver.remote',
+                                      'getAttribute.js').decode('utf8')
+
+_JS_ATRIBUTO_ELEMENTOS = '''
+var obtemAtributo = (%s);
+var nome = arguments[1];
+return arguments[0].map(function (elemento) {
+    return obtemAtributo(elemento, nome);
+});
+''' % _JS_OBTEM_ATRIBUTO
+
+_JS_ESTA_VISIVEL = pkgutil.get_data('selenium.webdriver.remote',
+                                    'isDisplayed.js').decode('utf8')
+
+_JS_TEXTO_ELEMENTOS = r'''
+var estaVisivel = (%s);
+return arguments[0].map(function (elemento) {
+    if (!estaVisivel(elemento)) {
+        return '';
+    }
+    var texto = typeof elemento.innerText === 'string' ?
+        elemento.innerText : elemento.textContent;
+    var linhas = (texto || '').replace(/[\u200b\u200e\u200f]/g, '')
+        .split('\n').map(function (linha) {
+            return linha.replace(/^[^\S\xa0]+|[^\S\xa0]+$/g, '');
+        });
+    return linhas.join('\n').replace(/^\n+|\n+$/g, '').replace(/\xa0/g, ' ');
+});
+''' % _JS_ESTA_VISIVEL
+
+_XPATH_SIMPLES = re.compile(
+    r'''^//([A-Za-z][\w-]*|\*)\[@(id|class)='''
+    r'''(['"])([^'"\\\x00-\x1f\x7f]*)\3\]$''')
+
+
+def _condicao_padrao(valor):
+    """Condição padrão que aceita qualquer valor."""
+    return True
+
+
+def _formato_padrao(valor):
+    """Formatação padrão que mantém o valor inalterado."""
+    return valor
+
+
+def _normaliza_seletor(tipo_seletor, seletor):
+    """Converte XPaths simples por id ou class, como //div[@id='x'], no
+    seletor CSS equivalente, que é avaliado mais rapidamente."""
+    if tipo_seletor == By.XPATH:
+        correspondencia = _XPATH_SIMPLES.match(seletor)
+
+        if correspondencia is not None:
+            tag, atributo, _, valor = correspondencia.groups()
+            tag = '' if tag == '*' else tag
+            return By.CSS_SELECTOR, '{}[{}="{}"]'.format(tag, atributo, valor)
+
+    return tipo_seletor, seletor
 
 
 class DriverBase(metaclass=ABCMeta):
     """Driver auxiliar para selenium.webdriver"""
 
-    def __init__(self, caminho_driver, tempo_espera):
+    def __init__(self, caminho_driver, tempo_espera,
+                 intervalo_verificacao=0.25, headless=False,
+                 carrega_imagens=True, tempo_carregamento=None):
         """Inicializa e configura uma instância de DriverBase."""
         self._caminho_driver = caminho_driver
         self._tempo_espera = tempo_espera
+        self._intervalo_verificacao = intervalo_verificacao
+        self._headless = headless
+        self._carrega_imagens = carrega_imagens
+        self._tempo_carregamento = tempo_carregamento
         self._inicializa_driver()
+
+        if self._tempo_carregamento is not None:
+            self._driver.set_page_load_timeout(self._tempo_carregamento)
+
         self._inicializa_wait()
+        self._inicializa_acoes()
+        self._cache_elementos = {}
 
     def __getattr__(self, atributo):
         """Delega atributos para o objeto driver."""
         return getattr(self._driver, atributo)
 
+    def _acoes_limpas(self):
+        """Retorna a instância de ActionChains sem ações pendentes."""
+        acoes_w3c = getattr(self._acoes, 'w3c_actions', None)
+
+        if acoes_w3c is None:
+            self._acoes.reset_actions()
+        else:
+            for dispositivo in acoes_w3c.devices:
+                dispositivo.clear_actions()
+
+        return self._acoes
+
     def _aguarda_carregamento(self):
         """Aguarda carregamento da página de acordo com o tempo limite."""
         js_script = 'return document.readyState;'
-        tempo_inicial = time.time()
-        tempo_limite = tempo_inicial + self._tempo_espera
-        carregando = self.execute_script(js_script).lower() != 'complete'
 
-        while time.time() < tempo_limite and carregando:
-            carregando = self.execute_script(js_script).lower() != 'complete'
+        try:
+            self._wait_carregamento.until(
+                lambda d: d.execute_script(js_script).lower() == 'complete')
+        except TimeoutException:
+            pass
+
+    def _busca_elemento_visivel_cache(self, tipo_seletor, seletor):
+        """Busca e retorna elemento visível, reaproveitando o elemento
+        encontrado na última leitura pelo mesmo seletor enquanto ele
+        continuar visível.
+
+        O cache é descartado a cada chamada que possa alterar a página
+        (busca_*, clica_*, insere_*, aponta_para_elemento, manipula_alerta,
+        acessa_url e troca_frame). Mudanças feitas pela própria página ou
+        por chamadas diretas ao driver não são detectadas: com seletores que
+        dependem de estado (ex.: '.ativo' ou //li[last()]), o elemento
+        retornado pode não atender mais o seletor."""
+        chave = _normaliza_seletor(tipo_seletor, seletor)
+        elemento = self._cache_elementos.get(chave)
+
+        if elemento is not None:
+            try:
+                if elemento.is_displayed():
+                    return elemento
+            except (NoSuchElementException, StaleElementReferenceException):
+                pass
+
+        elemento = self._wait.until(
+            expected_conditions.visibility_of_element_located(chave))
+        self._cache_elementos[chave] = elemento
+        return elemento
 
     @abstractmethod
     def _encerra_driver(self):
         """Encerra a instância de webdriver."""
         pass
 
+    def _inicializa_acoes(self):
+        """Inicializa e configura uma instância de ActionChains."""
+        self._acoes = ActionChains(self._driver)
+
     @abstractmethod
     def _inicializa_driver(self):
         """Inicializa e configura uma instância de webdriver."""
         pass
 
     def _inicializa_wait(self):
-        """Inicializa e configura uma instância de WebDriverWait."""
+        """Inicializa e configura as instâncias de WebDriverWait."""
         self._wait = WebDriverWait(self._driver, self._tempo_espera)
+        self._wait_carregamento = WebDriverWait(
+            self._driver, self._tempo_espera,
+            poll_frequency=self._intervalo_verificacao)
+
+    def _itera_atributo_elementos(self, elementos, atributo,
+                                  funcao_condicao=None, funcao_formato=None):
+        """Gera o atributo dos elementos de acordo com determinada condição
+        em determinada formatação."""
+        if funcao_condicao is None:
+            funcao_condicao = _condicao_padrao
+
+        if funcao_formato is None:
+            funcao_formato = _formato_padrao
+
+        valores = self._driver.execute_script(_JS_ATRIBUTO_ELEMENTOS,
+                                              elementos, atributo)
+
+        for valor in valores:
+            if funcao_condicao(valor):
+                yield funcao_formato(valor)
 
     def acessa_url(self, url):
-        """Acessa uma url."""
+        """Acessa uma url.
+
+        Lança TimeoutException se a página não carregar dentro de
+        tempo_carregamento ou, se ele não for informado, do tempo limite
+        padrão do driver."""
+        self._cache_elementos.clear()
         self._driver.get(url)
 
     def aponta_para_elemento(self, tipo_seletor, seletor):
         """Simula a ação de mouseover em um elemento."""
-        self._aguarda_carregamento()
-        ActionChains(self._driver).move_to_element(
+        self._acoes_limpas().move_to_element(
             self.busca_elemento_visivel(tipo_seletor, seletor)).perform()
 
     def busca_elemento_clicavel(self, tipo_seletor, seletor):
         """Busca e retorna elemento clicável."""
-        self._aguarda_carregamento()
+        self._cache_elementos.clear()
         return self._wait.until(expected_conditions.element_to_be_clickable(
-            (tipo_seletor, seletor)))
+            _normaliza_seletor(tipo_seletor, seletor)))
 
     def busca_elemento_visivel(self, tipo_seletor, seletor):
         """Busca e retorna elemento visível."""
-        self._aguarda_carregamento()
+        self._cache_elementos.clear()
         return self._wait.until(
             expected_conditions.visibility_of_element_located(
-                (tipo_seletor, seletor)))
+                _normaliza_seletor(tipo_seletor, seletor)))
 
     def busca_elementos(self, tipo_seletor, seletor):
         """Busca e retorna elementos."""
-        self._aguarda_carregamento()
+        self._cache_elementos.clear()
         return self._wait.until(
             expected_conditions.presence_of_all_elements_located(
-                (tipo_seletor, seletor)))
+                _normaliza_seletor(tipo_seletor, seletor)))
+
+    def busca_elementos_opcional(self, tipo_seletor, seletor):
+        """Busca e retorna elementos sem aguardar, podendo retornar uma
+        lista vazia."""
+        self._cache_elementos.clear()
+        return self._driver.find_elements(
+            *_normaliza_seletor(tipo_seletor, seletor))
 
     def clica_elemento(self, tipo_seletor, seletor):
         """Busca e clica em elemento."""
-        self._aguarda_carregamento()
-        ActionChains(self._driver).move_to_element(
-            self.busca_elemento_visivel(tipo_seletor,
-                                        seletor)).click().perform()
+        self._acoes_limpas().move_to_element(
+            self.busca_elemento_clicavel(tipo_seletor,
+                                         seletor)).click().perform()
+
+    def clica_elemento_rapido(self, tipo_seletor, seletor):
+        """Busca e clica em elemento sem simular o movimento do mouse."""
+        self.busca_elemento_clicavel(tipo_seletor, seletor).click()
 
     def clica_botao_direito_elemento(self, tipo_seletor=None, seletor=None):
         """Busca e clica com o botão direito no elemento ou na posição
         atual do mouse."""
-        self._aguarda_carregamento()
-
         if tipo_seletor is not None:
-            ActionChains(self._driver).context_click(
+            self._acoes_limpas().context_click(
                 self.busca_elemento_clicavel(tipo_seletor, seletor)).perform()
         else:
-            ActionChains(self._driver).context_click().perform()
+            self._acoes_limpas().context_click().perform()
+
+        self._cache_elementos.clear()
 
     def insere_opcao_elemento(self, tipo_seletor, seletor, valor_opcao):
         """Busca e seleciona opção por opção em elemento."""
-        self._aguarda_carregamento()
-        Select(self.busca_elemento_visivel(tipo_seletor,
-                                           seletor)).select_by_value(valor_opcao)
+        elemento = self.busca_elemento_clicavel(tipo_seletor, seletor)
+        Select(elemento).select_by_value(valor_opcao)
 
     def insere_texto_elemento(self, tipo_seletor, seletor, texto, enter=False):
         """Busca, insere texto e "tecla" ENTER em elemento."""
-        self._aguarda_carregamento()
-        elemento = self.busca_elemento_visivel(tipo_seletor, seletor)
+        elemento = self.busca_elemento_clicavel(tipo_seletor, seletor)
         elemento.clear()
-        elemento.send_keys(texto)
 
         if enter:
-            elemento.send_keys(Keys.ENTER)
+            elemento.send_keys(texto, Keys.ENTER)
+        else:
+            elemento.send_keys(texto)
 
     def manipula_alerta(self, acao='aceitar'):
         """Aceita ou descarta um alerta."""
@@ -121,83 +271,65 @@ class DriverBase(metaclass=ABCMeta):
             self._driver.switch_to.alert.accept()
         else:
             self._driver.switch_to.alert.dismiss()
+
+        self._cache_elementos.clear()
             
     def retorna_atributo_elemento(self, tipo_seletor, seletor, atributo):
         """Busca e retorna um atributo do elemento."""
-        self._aguarda_carregamento()
-        self.busca_elemento_visivel(tipo_seletor,
-                                    seletor).get_attribute(atributo)
+        elemento = self._busca_elemento_visivel_cache(tipo_seletor, seletor)
+        return elemento.get_attribute(atributo)
 
     def retorna_atributo_elementos(self, tipo_seletor, seletor, atributo,
                                    funcao_condicao=None, funcao_formato=None):
         """Busca e retorna um atributo dos elementos de acordo com
         determinada condição em determinada formatação."""
+        elementos = self.busca_elementos(tipo_seletor, seletor)
 
-        def funcao_aux_condicao(atributo):
-            return True
-
-        def funcao_aux_formato(atributo):
-            return atributo
+        if funcao_condicao is None and funcao_formato is None:
+            return self._driver.execute_script(_JS_ATRIBUTO_ELEMENTOS,
+                                               elementos, atributo)
 
-        if funcao_condicao is None:
-            funcao_condicao = funcao_aux_condicao
-
-        if funcao_formato is None:
-            funcao_formato = funcao_aux_formato
-
-        self._aguarda_carregamento()
-        elementos = self.busca_elementos(tipo_seletor, seletor)
-        atributos = [funcao_formato(e.get_attribute(atributo))
-                     for e in elementos if funcao_condicao(
-                        e.get_attribute(atributo))]
-        return atributos
+        return list(self._itera_atributo_elementos(elementos, atributo,
+                                                   funcao_condicao,
+                                                   funcao_formato))
 
     def retorna_numero_elementos(self, tipo_seletor, seletor, atributo=None,
                                  funcao_condicao=None):
         """Busca e retorna o número de elementos nos quais determinado
         atributo atende determinada condição."""
-        self._aguarda_carregamento()
+        elementos = self.busca_elementos_opcional(tipo_seletor, seletor)
 
-        if atributo is not None:
-            return len(self.retorna_atributo_elementos(tipo_seletor,
-                                                       seletor, atributo,
-                                                       funcao_condicao))
+        if atributo is None or funcao_condicao is None:
+            return len(elementos)
 
-        return len(self.busca_elementos(tipo_seletor, seletor))
+        return sum(1 for _ in self._itera_atributo_elementos(
+            elementos, atributo, funcao_condicao))
 
     def retorna_texto_elemento(self, tipo_seletor, seletor):
         """Busca e retorna o texto do elemento."""
-        self._aguarda_carregamento()
-        return self.busca_elemento_visivel(tipo_seletor, seletor).text
+        return self._busca_elemento_visivel_cache(tipo_seletor, seletor).text
 
     def retorna_texto_elementos(self, tipo_seletor, seletor,
                                 funcao_condicao=None, funcao_formato=None):
         """Busca e retorna o texto dos elementos de acordo com
         determinada condição em determinada formatação."""
+        elementos = self.busca_elementos(tipo_seletor, seletor)
+        valores = self._driver.execute_script(_JS_TEXTO_ELEMENTOS, elementos)
 
-        def funcao_aux_condicao(texto):
-            return True
-
-        def funcao_aux_formato(texto):
-            return texto
+        if funcao_condicao is None and funcao_formato is None:
+            return valores
 
         if funcao_condicao is None:
-            funcao_condicao = funcao_aux_condicao
+            funcao_condicao = _condicao_padrao
 
         if funcao_formato is None:
-            funcao_formato = funcao_aux_formato
+            funcao_formato = _formato_padrao
 
-        self._aguarda_carregamento()
-        elementos = self.busca_elementos(tipo_seletor, seletor)
-        textos = [funcao_formato(e.text)
-                  for e in elementos if funcao_condicao(
-                    e.text)]
+        textos = [funcao_formato(t) for t in valores if funcao_condicao(t)]
         return textos
 
     def troca_frame(self, tipo_seletor=None, seletor_frame=None):
         """Troca o foco do river para outro frame."""
-        self._aguarda_carregamento()
-
         if tipo_seletor is None or seletor_frame is None:
             self._driver.switch_to_default_content()
         else:
@@ -205,14 +337,68 @@ class DriverBase(metaclass=ABCMeta):
                 expected_conditions.frame_to_be_available_and_switch_to_it(
                     (tipo_seletor, seletor_frame)))
 
+        self._aguarda_carregamento()
+        self._cache_elementos.clear()
+
 
 class ChromeDriver(DriverBase):
     """Driver Chrome auxiliar para selenium.webdriver."""
 
     def _encerra_driver(self):
         """Encerra a instância de webdriver."""
-        self._driver.close()
+        self._driver.quit()
 
     def _inicializa_driver(self):
         """Inicializa e configura uma instância de webdriver."""
-        self._driver = webdriver.Chrome(self._caminho_driver)
+        opcoes = webdriver.ChromeOptions()
+
+        if self._headless:
+            opcoes.add_argument('--headless=new')
+            opcoes.add_argument('--disable-gpu')
+            opcoes.add_argument('--disable-extensions')
+            opcoes.add_argument('--disable-dev-shm-usage')
+
+        if not self._carrega_imagens:
+            opcoes.add_argument('--blink-settings=imagesEnabled=false')
+
+        self._driver = webdriver.Chrome(self._caminho_driver, options=opcoes)
+
+
+def _executa_tarefas(fabrica_driver, tarefas):
+    """Executa tarefas em sequência com um único driver e retorna seus
+    resultados."""
+    driver = fabrica_driver()
+
+    try:
+        return [tarefa(driver) for tarefa in tarefas]
+    finally:
+        driver._encerra_driver()
+
+
+def executa_em_paralelo(tarefas, numero_processos, fabrica_driver):
+    """Distribui as tarefas entre processos, cada um com o seu próprio driver
+    criado por fabrica_driver, e retorna os resultados na ordem das tarefas.
+
+    Cada tarefa recebe o driver como único argumento. Tarefas e fabrica_driver
+    devem ser serializáveis por pickle (ex.: funções de módulo ou
+    functools.partial(ChromeDriver, caminho_driver, tempo_espera))."""
+    if numero_processos < 1:
+        raise ValueError('numero_processos deve ser maior que zero.')
+
+    tarefas = list(tarefas)
+
+    if not tarefas:
+        return []
+
+    numero_processos = min(numero_processos, len(tarefas))
+    resultados = [None] * len(tarefas)
+
+    with ProcessPoolExecutor(numero_processos) as executor:
+        futuros = [executor.submit(_executa_tarefas, fabrica_driver,
+                                   tarefas[i::numero_processos])
+                   for i in range(numero_processos)]
+
+        for i, futuro in enumerate(futuros):
+            resultados[i::numero_processos] = futuro.result()
+
+    return resultados